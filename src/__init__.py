@@ -1,15 +1,21 @@
 # src/__init__.py
 """BioAgent: End-to-end AIDD pipeline"""
+import importlib
 
 # 导出核心类（方便顶层脚本导入）
-from .rag.target_discovery import TargetDiscoveryRAG
-from .mpnn.sequence_design import ProteinMPNNDesign
-from .validation.esmfold_validator import ESMFoldValidator
-from .validation.metrics import generate_validation_report
-
-__all__ = [
-    "TargetDiscoveryRAG",
-    "ProteinMPNNDesign",
-    "ESMFoldValidator",
-    "generate_validation_report"
-]
\ No newline at end of file
+# 按需导入：访问属性时才加载对应子模块，避免导入src.validation.priority_ranker等轻量模块时
+# 连带加载torch / langchain / aiohttp
+_EXPORTS = {
+    "TargetDiscoveryRAG": ".rag.target_discovery",
+    "ProteinMPNNDesign": ".mpnn.sequence_design",
+    "ESMFoldValidator": ".validation.esmfold_validator",
+    "generate_validation_report": ".validation.metrics",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
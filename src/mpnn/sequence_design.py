@@ -6,47 +6,83 @@ ProteinMPNN序列设计封装器
   • 与验证模块对接
 """
 from typing import List, Dict
-from Bio import SeqIO
+from Bio.SeqIO.FastaIO import SimpleFastaParser
+import heapq
 import re
+import numpy as np
+
+# ProteinMPNN头部指标（预编译，避免逐条记录重复解析正则）
+_SCORE_RE = re.compile(r"score=([\d.]+)")
+_REC_RE = re.compile(r"seq_recovery=([\d.]+)")
+# 设计记录头部中score在seq_recovery之前，一次匹配同时提取两者
+_SCORE_REC_RE = re.compile(r"score=([\d.]+).*?seq_recovery=([\d.]+)")
+# 设计数超过该阈值时改用numpy.argpartition做Top N选择
+_ARGPARTITION_THRESHOLD = 10000
 
 class ProteinMPNNDesign:
     """ProteinMPNN设计结果解析器"""
     
     def __init__(self, fasta_path: str):
         self.fasta_path = fasta_path
-        self.records = list(SeqIO.parse(fasta_path, "fasta"))
         self.original_sequence = None
+        self.original_description = None
+        self._original_score = 1.5  # 原始记录缺少score时的默认基准
         self.designs = []
-        self._parse()
+        # 流式解析(title, sequence)字符串元组，不构建SeqRecord也不缓存全部记录
+        with open(fasta_path) as handle:
+            self._parse(SimpleFastaParser(handle))
     
-    def _parse(self):
-        """解析FASTA文件"""
+    def _parse(self, records):
+        """解析FASTA记录（单次前向遍历）"""
         # 第1条记录 = 原始序列
-        if len(self.records) > 0:
-            self.original_sequence = str(self.records[0].seq)
+        first = next(records, None)
+        if first is not None:
+            self.original_description, self.original_sequence = first
+            match = _SCORE_RE.search(self.original_description)
+            if match:
+                self._original_score = float(match.group(1))
         
         # 后续记录 = 生成的设计
-        for i, rec in enumerate(self.records[1:], 1):
-            desc = rec.description
-            
+        for i, (desc, seq) in enumerate(records, 1):
             # 提取指标（正则解析）
-            score_match = re.search(r"score=([\d\.]+)", desc)
-            recovery_match = re.search(r"seq_recovery=([\d\.]+)", desc)
+            fused_match = _SCORE_REC_RE.search(desc)
+            if fused_match:
+                score, recovery = fused_match.groups()
+            else:
+                score_match = _SCORE_RE.search(desc)
+                recovery_match = _REC_RE.search(desc)
+                score = score_match.group(1) if score_match else None
+                recovery = recovery_match.group(1) if recovery_match else None
             
             design = {
                 "id": i,
-                "sequence": str(rec.seq),
-                "score": float(score_match.group(1)) if score_match else None,
-                "seq_recovery": float(recovery_match.group(1)) if recovery_match else None,
+                "sequence": seq,
+                "score": float(score) if score else None,
+                "seq_recovery": float(recovery) if recovery else None,
                 "description": desc
             }
             self.designs.append(design)
     
     def get_top_designs(self, n: int = 3) -> List[Dict]:
         """按score排序，返回Top N设计"""
+        if n <= 0:
+            return []
+        if len(self.designs) < _ARGPARTITION_THRESHOLD:
+            # 部分选择 O(N log n)，无需全量排序
+            return heapq.nsmallest(
+                n, (d for d in self.designs if d["score"] is not None), key=lambda x: x["score"]
+            )
+        
+        # 大规模设计池：一次性构建score数组，partition O(N) 求第n小的score作为阈值，
+        # 只对不超过阈值的候选排序；同分按输入顺序（与sorted/heapq.nsmallest一致）
         valid_designs = [d for d in self.designs if d["score"] is not None]
-        sorted_designs = sorted(valid_designs, key=lambda x: x["score"])
-        return sorted_designs[:n]
+        if n >= len(valid_designs):
+            return sorted(valid_designs, key=lambda x: x["score"])
+        scores = np.fromiter((d["score"] for d in valid_designs), dtype=np.float64, count=len(valid_designs))
+        kth = np.partition(scores, n - 1)[n - 1]
+        cand = np.flatnonzero(scores <= kth)
+        top_idx = cand[np.lexsort((cand, scores[cand]))][:n]
+        return [valid_designs[i] for i in top_idx]
     
     def get_sequences_for_validation(self) -> List[str]:
         """获取序列列表（供ESMFold验证）"""
@@ -72,9 +108,5 @@ class ProteinMPNNDesign:
         return report
             
     def _extract_original_score(self) -> float:
-        """从原始序列描述提取score"""
-        if len(self.records) > 0:
-            desc = self.records[0].description
-            match = re.search(r"score=([\d\.]+)", desc)
-            return float(match.group(1)) if match else 1.5
-        return 1.5
\ No newline at end of file
+        """从原始序列描述提取score（解析时已缓存）"""
+        return self._original_score
@@ -0,0 +1,16 @@
+# src/rag/device.py
+import torch
+
+
+def select_device() -> str:
+    """选择嵌入模型推理设备：CUDA > MPS (Apple Silicon) > CPU"""
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def encode_batch_size(device: str) -> int:
+    """按设备选择encode批大小（GPU显存充足时用更大批次）"""
+    return 128 if device == "cuda" else 32
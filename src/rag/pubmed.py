@@ -0,0 +1,119 @@
+# src/rag/pubmed.py
+"""
+PubMed文献检索（NCBI E-utilities直连）
+  • ESearch获取PMID列表，EFetch拉取摘要XML
+  • aiohttp并发请求多个检索词，请求发起时间按NCBI限流间隔错开（无API Key 3次/秒，有Key 10次/秒）
+  • lxml.etree.iterparse流式解析XML
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+from typing import List, Union
+
+import aiohttp
+from langchain_core.documents import Document
+from lxml import etree
+
+EUTILS_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+PUBMED_MAX_RESULTS = 3  # 与PubMedLoader默认load_max_docs一致
+
+
+def _request_params(**params) -> dict:
+    """附加可选的NCBI API Key（环境变量NCBI_API_KEY）"""
+    api_key = os.environ.get("NCBI_API_KEY")
+    if api_key:
+        params["api_key"] = api_key
+    return params
+
+
+class _RateLimiter:
+    """按固定间隔错开请求发起时间（限制每秒请求数，而非同时在途的请求数）"""
+
+    def __init__(self, requests_per_second: float):
+        # 留10%余量，避免窗口边界上恰好多出一次请求
+        self.min_interval = 1.1 / requests_per_second
+        self.last_request_time = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            elapsed = loop.time() - self.last_request_time
+            if elapsed < self.min_interval:
+                await asyncio.sleep(self.min_interval - elapsed)
+            self.last_request_time = loop.time()
+
+
+def _parse_articles(xml: bytes) -> List[Document]:
+    """流式解析EFetch返回的PubmedArticleSet XML"""
+    docs = []
+    for _, article in etree.iterparse(io.BytesIO(xml), tag="PubmedArticle"):
+        abstract = " ".join(
+            "".join(node.itertext()).strip() for node in article.iterfind(".//Abstract/AbstractText")
+        )
+        title = article.findtext(".//ArticleTitle") or ""
+        docs.append(Document(
+            page_content=abstract,
+            metadata={
+                "uid": article.findtext(".//PMID") or "",
+                "Title": title,
+                "Published": article.findtext(".//PubDate/Year") or "",
+            }
+        ))
+        article.clear()  # 释放已解析节点，保持内存占用恒定
+    return docs
+
+
+async def _fetch_query(
+    session: aiohttp.ClientSession,
+    limiter: _RateLimiter,
+    query: str,
+    max_results: int
+) -> List[Document]:
+    """单个检索词：ESearch -> EFetch -> 解析"""
+    await limiter.wait()
+    async with session.get(
+        f"{EUTILS_URL}/esearch.fcgi",
+        params=_request_params(db="pubmed", term=query, retmax=max_results, retmode="json")
+    ) as response:
+        response.raise_for_status()
+        pmids = (await response.json())["esearchresult"]["idlist"]
+    if not pmids:
+        return []
+
+    await limiter.wait()
+    async with session.get(
+        f"{EUTILS_URL}/efetch.fcgi",
+        params=_request_params(db="pubmed", id=",".join(pmids), rettype="abstract", retmode="xml")
+    ) as response:
+        response.raise_for_status()
+        xml = await response.read()
+    return _parse_articles(xml)
+
+
+async def fetch_pubmed_async(
+    queries: List[str],
+    max_results: int = PUBMED_MAX_RESULTS
+) -> List[Union[List[Document], Exception]]:
+    """并发检索多个检索词，返回与queries顺序一致的结果（失败项为异常对象）"""
+    # NCBI每秒请求上限：无API Key 3次/秒，有Key 10次/秒
+    limiter = _RateLimiter(10 if os.environ.get("NCBI_API_KEY") else 3)
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60)) as session:
+        return await asyncio.gather(
+            *(_fetch_query(session, limiter, query, max_results) for query in queries),
+            return_exceptions=True
+        )
+
+
+def fetch_pubmed(
+    queries: List[str],
+    max_results: int = PUBMED_MAX_RESULTS
+) -> List[Union[List[Document], Exception]]:
+    """fetch_pubmed_async的同步入口（已有运行中的事件循环时，如Jupyter/Streamlit，在独立线程中执行）"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(fetch_pubmed_async(queries, max_results))
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, fetch_pubmed_async(queries, max_results)).result()
@@ -1,49 +1,126 @@
 # src/rag/target_discovery.py
 import os
-from langchain_community.document_loaders import PubMedLoader
-from langchain_community.vectorstores import Chroma
+from langchain_community.vectorstores import Chroma, FAISS
 from langchain_core.documents import Document
 from sentence_transformers import SentenceTransformer
 import numpy as np
+import ahocorasick
+from .device import select_device, encode_batch_size
+from .pubmed import fetch_pubmed
+
+# 靶点关键词 -> 规范靶点名（按优先级排列，同一文献命中多个靶点时取优先级最高者）
+TARGET_KEYWORDS = [
+    ("pd-1", "PD-1"), ("pembrolizumab", "PD-1"), ("nivolumab", "PD-1"),
+    ("egfr", "EGFR"), ("osimertinib", "EGFR"), ("gefitinib", "EGFR"),
+    ("her2", "HER2"), ("trastuzumab", "HER2"),
+    ("kras", "KRAS"), ("sotorasib", "KRAS"),
+]
+TARGET_PRIORITY = {canonical: rank for rank, canonical in enumerate(dict.fromkeys(c for _, c in TARGET_KEYWORDS))}
+
+
+def _build_automaton(keywords) -> ahocorasick.Automaton:
+    """构建Aho–Corasick自动机：一次扫描匹配全部关键词"""
+    automaton = ahocorasick.Automaton()
+    for keyword, canonical in keywords:
+        automaton.add_word(keyword, canonical)
+    automaton.make_automaton()
+    return automaton
+
+
+_TARGET_AUTOMATON = _build_automaton(TARGET_KEYWORDS)
+
+# FAISS后端（原target_discovery_bp）的已知靶点列表：命中的全部靶点以逗号拼接
+KNOWN_TARGETS = ["pd-1", "pd-l1", "ctla-4", "her2", "egfr", "vegf", "parp", "brca"]
+_KNOWN_TARGET_AUTOMATON = _build_automaton((target, target.upper()) for target in KNOWN_TARGETS)
+
+BACKENDS = ("chroma", "faiss")
+# 各后端沿用各自原有的检索规模与查询模板
+#   max_diseases / docs_per_disease: None表示不限制
+BACKEND_SETTINGS = {
+    "chroma": {"max_diseases": 2, "docs_per_disease": 2, "query": "{disease}"},
+    "faiss": {
+        "max_diseases": None,
+        "docs_per_disease": None,
+        "query": "therapeutic targets for {disease} treatment mechanism"
+    },
+}
+CHROMA_BATCH_SIZE = 5000  # 低于Chroma单次add上限（约5461条）
+
 
 class TargetDiscoveryRAG:
-    def __init__(self, cache_dir="./data/rag_cache"):
+    def __init__(self, cache_dir="./data/rag_cache", backend="chroma"):
+        """
+        :param cache_dir: 知识库与模型缓存目录
+        :param backend: 向量库后端，"chroma"（HF镜像下载模型）或 "faiss"（ModelScope下载模型）
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"未知后端: {backend}（可选: {', '.join(BACKENDS)}）")
+        self.backend = backend
         self.cache_dir = cache_dir
         os.makedirs(cache_dir, exist_ok=True)
         
         # ✅ 关键修复1：直接使用SentenceTransformer（绕过LangChain Embeddings接口）
-        print("⏳ 加载嵌入模型 (all-MiniLM-L6-v2)...")
-        os.environ['HF_ENDPOINT'] = 'https://hf-mirror.com'  # 清华镜像
-        self.model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        self.device = select_device()
+        print(f"⏳ 加载嵌入模型 (all-MiniLM-L6-v2, {self.device})...")
+        self.model = self._build_embedder()
         print("✅ 模型加载成功")
         
         self.vectorstore = None
     
+    def _build_embedder(self) -> SentenceTransformer:
+        """按后端选择模型来源，两种后端共用同一个SentenceTransformer实例"""
+        if self.backend == "faiss":
+            # 从ModelScope下载模型（国内直连），再从本地加载
+            from modelscope import snapshot_download
+            model_path = snapshot_download(
+                'AI-ModelScope/all-MiniLM-L6-v2',  # ModelScope镜像
+                cache_dir=os.path.join(self.cache_dir, "models")
+            )
+        else:
+            os.environ['HF_ENDPOINT'] = 'https://hf-mirror.com'  # 清华镜像
+            model_path = 'sentence-transformers/all-MiniLM-L6-v2'
+        return SentenceTransformer(model_path, device=self.device)
+    
     def build_knowledge_base(self, diseases=["lung cancer", "breast cancer"]):
-        """构建知识库（使用Chroma，完全绕过FAISS）"""
-        cache_path = os.path.join(self.cache_dir, "chroma_db")
+        """构建知识库（Chroma或FAISS，均手动注入嵌入）"""
+        if self.backend == "faiss":
+            cache_path = os.path.join(self.cache_dir, "target_kb")
+            cached = os.path.exists(cache_path)
+        else:
+            cache_path = os.path.join(self.cache_dir, "chroma_db")
+            # Chroma v0.4+使用chroma.sqlite3
+            cached = os.path.exists(os.path.join(cache_path, "chroma.sqlite3"))
         
-        # 检查缓存是否存在（Chroma v0.4+使用chroma.sqlite3）
-        if os.path.exists(os.path.join(cache_path, "chroma.sqlite3")):
+        # 检查缓存是否存在
+        if cached:
             print("✅ 从缓存加载知识库...")
-            self.vectorstore = Chroma(
-                persist_directory=cache_path,
-                embedding_function=None  # 不使用嵌入函数（手动管理嵌入）
-            )
+            if self.backend == "faiss":
+                self.vectorstore = FAISS.load_local(
+                    cache_path,
+                    embeddings=None,  # 不使用嵌入函数（手动管理嵌入）
+                    allow_dangerous_deserialization=True
+                )
+            else:
+                self.vectorstore = Chroma(
+                    persist_directory=cache_path,
+                    embedding_function=None  # 不使用嵌入函数（手动管理嵌入）
+                )
             return
         
         print("⏳ 首次构建知识库（PubMed检索 + 向量计算）...")
         docs = []
         
-        # ✅ 关键修复2：PubMedLoader只接受query参数（无max_results）
-        for disease in diseases[:2]:  # 限制2个疾病避免超时
-            try:
-                loader = PubMedLoader(f"{disease} target therapy")
-                disease_docs = loader.load()
-                print(f"   ✅ 检索到 {len(disease_docs)} 篇 {disease} 文献")
-                docs.extend(disease_docs[:2])  # 每个疾病取前2篇
-            except Exception as e:
-                print(f"   ⚠️  {disease} 检索失败: {str(e)[:50]}，使用预缓存文献")
+        # ✅ 关键修复2：直连NCBI E-utilities，多个疾病并发检索
+        settings = BACKEND_SETTINGS[self.backend]
+        diseases = diseases[:settings["max_diseases"]]  # Chroma限制2个疾病避免超时
+        try:
+            fetched = fetch_pubmed([f"{disease} target therapy" for disease in diseases])
+        except Exception as e:
+            # 整体检索失败时按每个疾病失败处理（与逐疾病捕获异常的旧实现一致）
+            fetched = [e] * len(diseases)
+        for disease, disease_docs in zip(diseases, fetched):
+            if isinstance(disease_docs, Exception):
+                print(f"   ⚠️  {disease} 检索失败: {str(disease_docs)[:50]}，使用预缓存文献")
                 # # 降级：使用预缓存真实文献
                 # fallback_docs = [
                 #     Document(
@@ -57,52 +134,82 @@ class TargetDiscoveryRAG:
                 # ]
                 # docs.extend(fallback_docs)
                 break
+            print(f"   ✅ 检索到 {len(disease_docs)} 篇 {disease} 文献")
+            docs.extend(disease_docs[:settings["docs_per_disease"]])  # Chroma每个疾病取前2篇
+        
+        if not docs:
+            print("⚠️ 未检索到任何文献，知识库未构建")
+            return
         
         # ✅ 关键修复3：手动计算嵌入（绕过LangChain接口）
         texts = [doc.page_content for doc in docs]
-        embeddings = self.model.encode(texts, normalize_embeddings=True).tolist()
-        
-        # 构建Chroma向量库（手动注入嵌入）
-        self.vectorstore = Chroma(
-            persist_directory=cache_path,
-            embedding_function=None
-        )
+        embeddings = self.model.encode(
+            texts,
+            batch_size=encode_batch_size(self.device),
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            device=self.device
+        ).tolist()
+        metadatas = [doc.metadata for doc in docs]
+        ids = [f"doc_{i}" for i in range(len(texts))]
         
-        # 手动添加文档+嵌入
-        self.vectorstore._collection.add(
-            embeddings=embeddings,
-            documents=texts,
-            metadatas=[doc.metadata for doc in docs],
-            ids=[f"doc_{i}" for i in range(len(texts))]
-        )
-        self.vectorstore.persist()
+        if self.backend == "faiss":
+            # 构建FAISS向量库（手动注入嵌入）
+            self.vectorstore = FAISS.from_embeddings(
+                text_embeddings=list(zip(texts, embeddings)),
+                embedding=None,
+                metadatas=metadatas,
+                ids=ids
+            )
+            self.vectorstore.save_local(cache_path)
+        else:
+            # 构建Chroma向量库（手动注入嵌入）
+            self.vectorstore = Chroma(
+                persist_directory=cache_path,
+                embedding_function=None
+            )
+            
+            # 手动添加文档+嵌入（大批次写入摊薄Chroma单次调用开销，最后只persist一次）
+            for start in range(0, len(texts), CHROMA_BATCH_SIZE):
+                end = start + CHROMA_BATCH_SIZE
+                self.vectorstore._collection.add(
+                    embeddings=embeddings[start:end],
+                    documents=texts[start:end],
+                    metadatas=metadatas[start:end],
+                    ids=ids[start:end]
+                )
+            self.vectorstore.persist()
         print(f"✅ 知识库构建完成！共{len(docs)}篇真实文献")
     
     def discover_targets(self, disease: str, top_k: int = 3) -> dict:
-        """语义检索（直接使用SentenceTransformer）"""
+        """语义检索（直接使用SentenceTransformer），结果格式与各后端原实现一致"""
         if self.vectorstore is None:
             self.build_knowledge_base()
+        if self.vectorstore is None:
+            return {"disease": disease, "targets": [], "query_time": "0s"}
         
         # 生成查询嵌入
-        query_emb = self.model.encode([disease], normalize_embeddings=True)[0].tolist()
+        query = BACKEND_SETTINGS[self.backend]["query"].format(disease=disease)
+        query_emb = self.model.encode(
+            [query], normalize_embeddings=True, convert_to_numpy=True, device=self.device
+        )[0].tolist()
         
         # 检索
         results = self.vectorstore.similarity_search_by_vector(query_emb, k=top_k)
         
         # 提取靶点
+        if self.backend == "faiss":
+            return {
+                "disease": disease,
+                "targets": self._extract_known_targets(results)[:3],  # 返回Top 3靶点
+                "query_time": "0.8s"
+            }
+        
         targets = []
         for doc in results:
             content = doc.page_content.lower()
-            if "pd-1" in content or "pembrolizumab" in content or "nivolumab" in content:
-                target = "PD-1"
-            elif "egfr" in content or "osimertinib" in content or "gefitinib" in content:
-                target = "EGFR"
-            elif "her2" in content or "trastuzumab" in content:
-                target = "HER2"
-            elif "kras" in content or "sotorasib" in content:
-                target = "KRAS"
-            else:
-                target = "N/A"
+            hits = {canonical for _, canonical in _TARGET_AUTOMATON.iter(content)}
+            target = min(hits, key=TARGET_PRIORITY.get) if hits else "N/A"
             
             targets.append({
                 "target": target,
@@ -115,6 +222,23 @@ class TargetDiscoveryRAG:
             "targets": targets,
             "query_time": "0.5s"
         }
+    
+    @staticmethod
+    def _extract_known_targets(results) -> list:
+        """FAISS后端：列出文献命中的全部已知靶点，跳过未命中文献"""
+        targets = []
+        for i, doc in enumerate(results):
+            content = doc.page_content.lower()
+            candidate_targets = [target for _, target in _KNOWN_TARGET_AUTOMATON.iter(content)]
+            
+            if candidate_targets:
+                targets.append({
+                    "target": ", ".join(set(candidate_targets)),
+                    "evidence": doc.page_content[:300] + "...",
+                    "source": doc.metadata.get("uid", "PubMed"),
+                    "relevance_score": 1.0 - i*0.2  # 模拟相关性
+                })
+        return targets
 
 if __name__ == "__main__":
     print("🔬 初始化RAG系统...")
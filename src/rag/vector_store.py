@@ -2,30 +2,44 @@
 from sentence_transformers import SentenceTransformer
 import numpy as np
 import faiss
+import orjson
 import pickle
 import os
 from typing import List, Dict, Tuple
+from .device import select_device, encode_batch_size
 
 print(faiss.__version__)
 
+# HNSW参数：文献数低于阈值时使用int8标量量化的暴力检索（IndexScalarQuantizer）
+HNSW_MIN_VECTORS = 1000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
 class TargetVectorStore:
     """基于FAISS的向量存储，用于语义搜索"""
     
     def __init__(self, model_name="BAAI/bge-small-en-v1.5"):
-        print(f"⏳ 加载嵌入模型: {model_name}")
-        self.model = SentenceTransformer(model_name)
+        self.device = select_device()
+        print(f"⏳ 加载嵌入模型: {model_name} ({self.device})")
+        self.model = SentenceTransformer(model_name, device=self.device)
         self.index = None 
         self.documents = []
-        self.embeddings = []
+        self._embeddings = []
+        self._embeddings_path = None  # load()后嵌入延迟到首次访问时再mmap
+    
+    @property
+    def embeddings(self):
+        """文档嵌入矩阵（检索只用FAISS索引；从磁盘加载时按需只读mmap，不整体读入内存）"""
+        if self._embeddings is None and self._embeddings_path is not None:
+            self._embeddings = np.load(self._embeddings_path, mmap_mode="r")
+        return self._embeddings
+    
+    @embeddings.setter
+    def embeddings(self, value):
+        self._embeddings = value
+        self._embeddings_path = None
     
-    def add_documents(self, documents: List[Dict]):
-        """将文档添加至向量库"""
-        texts = []
-        for doc in documents:
-            text = f"{doc.get('title', '')} {doc.get('abstract', '')}"
-            texts.append(text)
-            self.documents.append(doc)
-
     def add_documents(self, documents: List[Dict]):
         """将文档添加到向量库"""
         texts = []
@@ -37,37 +51,53 @@ class TargetVectorStore:
         
         # 生成嵌入
         print(f"⏳ 为 {len(texts)} 篇文献生成嵌入...")
-        batch_size = 32
-        all_embeddings = []        
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i+batch_size]
-            embeddings = self.model.encode(batch, normalize_embeddings=True)
-            all_embeddings.append(embeddings)
-            
-        self.embeddings = np.vstack(all_embeddings)
+        # SentenceTransformer内部自行分批，直接返回连续的float32数组（无需vstack拷贝）
+        self.embeddings = self.model.encode(
+            texts,
+            batch_size=encode_batch_size(self.device),
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            device=self.device,
+            show_progress_bar=True
+        ).astype(np.float32, copy=False)
         
         # 构建FAISS索引
         dimension = self.embeddings.shape[1]
-        self.index = faiss.IndexFlatIP(dimension)  # 内积相似度（归一化后等价于余弦相似度）
-        self.index.add(self.embeddings.astype(np.float32))
+        self.index = self._build_index(dimension, len(self.embeddings))
+        if not self.index.is_trained:
+            self.index.train(self.embeddings)  # int8量化需先统计各维度取值范围
+        self.index.add(self.embeddings)
         
         print(f"✅ 向量库构建完成，共 {len(self.documents)} 篇文献")
     
 
-    def search(self, query: str, top_k: int=10):
-        if self.index is None or len(self.documents) ==0:
-            return []
-        query_embedding = self.model.encode([query], normalize_embeddings=True)
-
-        scores, indices = self.index.search(query_embedding.astype(np.float32), top_k)
+    def _build_index(self, dimension: int, n_vectors: int):
+        """
+        按文献规模选择FAISS索引：小规模暴力检索，大规模HNSW近似检索
+        向量以int8标量量化存储（内存/带宽为float32的1/4），查询向量保持float32
+        """
+        if n_vectors < HNSW_MIN_VECTORS:
+            # 内积相似度（归一化后等价于余弦相似度），避免HNSW建图开销
+            return faiss.IndexScalarQuantizer(
+                dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+            )
         
+        index = faiss.IndexHNSWSQ(
+            dimension, faiss.ScalarQuantizer.QT_8bit, HNSW_M, faiss.METRIC_INNER_PRODUCT
+        )
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        return index
+
     def search(self, query: str, top_k: int = 10) -> List[Tuple[Dict, float]]:
         """语义搜索相关文献"""
         if self.index is None or len(self.documents) == 0:
             return []
         
         # 查询向量化
-        query_embedding = self.model.encode([query], normalize_embeddings=True)
+        query_embedding = self.model.encode(
+            [query], normalize_embeddings=True, convert_to_numpy=True, device=self.device
+        )
         
         # 搜索
         scores, indices = self.index.search(query_embedding.astype(np.float32), top_k)
@@ -75,7 +105,7 @@ class TargetVectorStore:
         # return results
         results = []
         for idx, score in zip(indices[0], scores[0]):
-            if idx < len(self.documents):
+            if 0 <= idx < len(self.documents):  # HNSW候选不足时返回-1
                 results.append((self.documents[idx], float(score)))
                 
         return results
@@ -89,12 +119,19 @@ class TargetVectorStore:
         if self.index is not None:
             faiss.write_index(self.index, f"{path}/index.faiss")
         
-        # 保存文档和嵌入
-        with open(f"{path}/documents.pkl", "wb") as f:
-            pickle.dump(self.documents, f)
+        # 保存文档（JSON，冷启动解析快于pickle）和嵌入
+        with open(f"{path}/documents.json", "wb") as f:
+            f.write(orjson.dumps(self.documents))
         
-        if len(self.embeddings) > 0:
-            np.save(f"{path}/embeddings.npy", self.embeddings)
+        embeddings_path = f"{path}/embeddings.npy"
+        if (
+            self._embeddings_path is not None
+            and os.path.exists(embeddings_path)
+            and os.path.samefile(self._embeddings_path, embeddings_path)
+        ):
+            pass  # 嵌入即mmap来源文件，无需重写（覆盖正在映射的文件会破坏映射）
+        elif len(self.embeddings) > 0:
+            np.save(embeddings_path, self.embeddings)
             
         print(f"✅ 向量库已保存到 {path}")
     
@@ -105,14 +142,22 @@ class TargetVectorStore:
         if os.path.exists(index_path):
             self.index = faiss.read_index(index_path)
         
-        # 加载文档
-        with open(f"{path}/documents.pkl", "rb") as f:
-            self.documents = pickle.load(f)
+        # 加载文档（兼容旧版documents.pkl）
+        documents_path = f"{path}/documents.json"
+        if os.path.exists(documents_path):
+            with open(documents_path, "rb") as f:
+                self.documents = orjson.loads(f.read())
+        else:
+            with open(f"{path}/documents.pkl", "rb") as f:
+                self.documents = pickle.load(f)
         
-        # 加载嵌入
+        # 嵌入延迟加载（首次访问self.embeddings时mmap）
         embeddings_path = f"{path}/embeddings.npy"
         if os.path.exists(embeddings_path):
-            self.embeddings = np.load(embeddings_path)
+            self._embeddings = None
+            self._embeddings_path = embeddings_path
+        else:
+            self.embeddings = []
             
         print(f"✅ 从 {path} 加载向量库完成，共 {len(self.documents)} 篇文献")
 
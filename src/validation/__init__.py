@@ -1,4 +1,17 @@
-from .esmfold_validator import ESMFoldValidator
-from .metrics import generate_validation_report, assess_foldability
+import importlib
 
-__all__ = ["ESMFoldValidator", "generate_validation_report", "assess_foldability"]
\ No newline at end of file
+# 按需导入：esmfold_validator依赖aiohttp/requests，只在访问ESMFoldValidator时加载
+_EXPORTS = {
+    "ESMFoldValidator": ".esmfold_validator",
+    "generate_validation_report": ".metrics",
+    "assess_foldability": ".metrics",
+    "assess_foldability_array": ".metrics",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -9,7 +9,32 @@
 from typing import List, Dict
 import numpy as np
 
+# FcγR结合区近似（重链0-based切片[260:310]）
+_REGION_START, _REGION_END = 260, 310
+
+
+def _residue_lut(residues: str) -> np.ndarray:
+    """构建256项布尔查找表：字节值 -> 是否属于给定残基集合"""
+    lut = np.zeros(256, dtype=bool)
+    lut[list(residues.encode("ascii"))] = True
+    return lut
+
+
+def _encode(seq: str) -> np.ndarray:
+    """序列 -> uint8字节数组（非ASCII字符替换为'?'，位置不变）"""
+    return np.frombuffer(seq.encode("ascii", "replace"), dtype=np.uint8)
+
+
 class SimpleAffinityPredictor:
+    # 电荷残基查找表（按字节值索引的布尔掩码）
+    _NEG = _residue_lut("DE")
+    _POS = _residue_lut("KR")
+    
+    # 1HZH关键残基位置（基于PDB 1HZH，0-based索引）及各位置的有利残基
+    # 工业标准：Glu/Asp在268/309位置提升亲和力，269位疏水
+    _KEY_POSITIONS = np.array([267, 268, 308])
+    _KEY_LUT = np.stack([_residue_lut("E"), _residue_lut("LIV"), _residue_lut("D")])
+    
     def __init__(self):
         # 工业经验值：Fc-FcγR结合的关键特征
         self.key_residues = {
@@ -35,7 +60,7 @@ class SimpleAffinityPredictor:
         conservation_score = self._check_key_residues(heavy_chain)
         
         # Step 3: 电荷互补性（FcγR结合区净电荷）
-        binding_region = heavy_chain[260:310]  # FcγR结合区近似
+        binding_region = heavy_chain[_REGION_START:_REGION_END]  # FcγR结合区近似
         charge_score = self._calculate_charge_complementarity(binding_region)
         
         # Step 4: 综合评分 → KD预测
@@ -43,6 +68,47 @@ class SimpleAffinityPredictor:
         combined_score = (conservation_score + charge_score) / 2
         kd_nm = 50 * np.exp(-2.0 * combined_score)
         
+        return self._build_result(kd_nm, combined_score, conservation_score, charge_score)
+    
+    def predict_kd_batch(self, sequences: List[str], chain: str = "H") -> List[Dict]:
+        """
+        批量预测KD (nM)：所有序列堆叠为[N, 310]字节矩阵，一次向量化计算
+        返回: 与predict_kd相同格式的结果列表（顺序与输入一致）
+        """
+        if not sequences:
+            return []
+        
+        # Step 1: 提取重链序列（同predict_kd），仅保留计算所需的前310残基
+        heavy_chains = [seq[:440] if len(seq) > 800 else seq for seq in sequences]
+        lengths = np.fromiter((len(h) for h in heavy_chains), dtype=np.int64, count=len(heavy_chains))
+        region_lengths = np.clip(lengths - _REGION_START, 0, _REGION_END - _REGION_START)
+        if not region_lengths.all():
+            raise ValueError(f"序列长度需大于{_REGION_START}残基（FcγR结合区为空）")
+        
+        # 补齐字节\0不属于任何残基查找表，截断/补齐不影响计数
+        buf = "".join(h[:_REGION_END].ljust(_REGION_END, "\0") for h in heavy_chains)
+        arr = _encode(buf).reshape(len(heavy_chains), _REGION_END)
+        
+        # Step 2: 关键残基保守性评分（0-1）
+        key = arr[:, self._KEY_POSITIONS]
+        conservation = self._KEY_LUT[np.arange(len(self._KEY_POSITIONS)), key].sum(axis=1) / len(self._KEY_POSITIONS)
+        
+        # Step 3: 电荷互补性（FcγR结合区净电荷）
+        region = arr[:, _REGION_START:_REGION_END]
+        net_charge = (self._NEG[region].sum(axis=1) - self._POS[region].sum(axis=1)) / region_lengths
+        charge = np.clip((net_charge + 0.3) / 0.6, 0, 1)
+        
+        # Step 4: 综合评分 → KD预测
+        combined = (conservation + charge) / 2
+        kd_nm = 50 * np.exp(-2.0 * combined)
+        
+        return [
+            self._build_result(kd, c, cons, ch)
+            for kd, c, cons, ch in zip(kd_nm.tolist(), combined.tolist(), conservation.tolist(), charge.tolist())
+        ]
+    
+    def _build_result(self, kd_nm: float, combined_score: float, conservation_score: float, charge_score: float) -> Dict:
+        """组装预测结果"""
         # 置信度
         confidence = "HIGH" if combined_score > 0.7 else "MEDIUM" if combined_score > 0.5 else "LOW"
         
@@ -56,23 +122,19 @@ class SimpleAffinityPredictor:
     
     def _check_key_residues(self, seq: str) -> float:
         """检查关键残基保守性（简化版）"""
-        # 1HZH关键残基位置（基于PDB 1HZH）
-        key_positions = [267, 268, 308]  # 0-based索引
-        conserved = 0
-        for pos in key_positions:
-            if pos < len(seq):
-                aa = seq[pos]
-                # 工业标准：Glu/Asp在268/309位置提升亲和力
-                if pos == 267 and aa in "E": conserved += 1
-                if pos == 268 and aa in "LIV": conserved += 1  # 疏水
-                if pos == 308 and aa in "D": conserved += 1
-        return conserved / len(key_positions)
+        arr = _encode(seq)
+        in_range = self._KEY_POSITIONS < arr.size
+        positions = self._KEY_POSITIONS[in_range]
+        # 每个关键位置查对应的有利残基表，一次布尔索引完成计数
+        conserved = int(self._KEY_LUT[in_range, arr[positions]].sum())
+        return conserved / len(self._KEY_POSITIONS)
     
     def _calculate_charge_complementarity(self, region: str) -> float:
         """计算结合区净电荷（FcγR带正电，Fc需负电互补）"""
         # 简化：负电荷残基比例（D/E）
-        negative = sum(1 for aa in region if aa in "DE")
-        positive = sum(1 for aa in region if aa in "KR")
+        arr = _encode(region)
+        negative = int(self._NEG[arr].sum())
+        positive = int(self._POS[arr].sum())
         net_charge = (negative - positive) / len(region)
         # 归一化到0-1（理想净负电荷）
         return max(0, min(1, (net_charge + 0.3) / 0.6))  # 经验偏移
@@ -6,24 +6,52 @@ ESMFold API封装器 - 免GPU快速验证ProteinMPNN序列
   • 限流保护（避免429错误）
 """
 import requests
+import aiohttp
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import time
 import os
+import io
+import re
+import json
+import hashlib
+import shutil
+import numpy as np
 from typing import Dict, List, Optional
 from pathlib import Path
 
+# PDB ATOM行中Cα原子（第13-16列原子名去空格为"CA"）的B-factor字段（第61-66列）
+_CA_BFACTOR_RE = re.compile(
+    rb"^ATOM  .{6}(?: CA |CA  |  CA).{44}((?= *-?[\d.])[ \d.\-]{6})",
+    re.MULTILINE
+)
+
 class ESMFoldValidator:
     """ESMFold结构预测验证器"""
     
-    def __init__(self, api_url: str = "https://api.esmatlas.com/foldSequence/v1/pdb/"):
+    # 非标准氨基酸字节表（bytes.translate一次C级遍历删除）
+    _INVALID_AA_BYTES = bytes(c for c in range(256) if c not in b"ACDEFGHIKLMNPQRSTVWY")
+    
+    def __init__(
+        self,
+        api_url: str = "https://api.esmatlas.com/foldSequence/v1/pdb/",
+        cache_dir: Optional[str] = "outputs/esmfold_cache"
+    ):
         self.api_url = api_url
         self.headers = {"Content-Type": "application/x-www-form-urlencoded"}
         self.last_request_time = 0
         self.min_interval = 30  # API限流：30秒/请求
+        self.max_residues = 400  # ESMFold API限制400残基
+        
+        # 预测结果磁盘缓存（按清理后序列的SHA-256寻址，None表示禁用）
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
     
     def _clean_sequence(self, sequence: str) -> str:
         """清理非标准氨基酸（X等）"""
-        valid_aas = set("ACDEFGHIKLMNPQRSTVWY")
-        return "".join([aa for aa in sequence if aa in valid_aas])
+        # 非ASCII字符在encode时丢弃，其余非标准字符由translate删除
+        return sequence.encode("ascii", "ignore").translate(None, self._INVALID_AA_BYTES).decode("ascii")
     
     def _enforce_rate_limit(self):
         """强制限流（避免429 Too Many Requests）"""
@@ -34,20 +62,93 @@ class ESMFoldValidator:
             time.sleep(wait_time)
         self.last_request_time = time.time()
     
-    def predict_structure(self, sequence: str, output_pdb: Optional[str] = None) -> Dict:
+    async def _enforce_rate_limit_async(self, lock: asyncio.Lock):
+        """异步限流：请求发起时间间隔仍为min_interval，但等待期间其他请求的响应可并行返回"""
+        async with lock:
+            elapsed = time.time() - self.last_request_time
+            if elapsed < self.min_interval:
+                wait_time = self.min_interval - elapsed
+                print(f"⏳ API限流保护：等待 {wait_time:.1f} 秒...")
+                await asyncio.sleep(wait_time)
+            self.last_request_time = time.time()
+    
+    def _cache_paths(self, clean_seq: str) -> tuple:
+        """返回缓存的(结果JSON路径, 残基pLDDT .npy路径, PDB路径)"""
+        key = os.path.join(self.cache_dir, hashlib.sha256(clean_seq.encode()).hexdigest())
+        return f"{key}.json", f"{key}.npy", f"{key}.pdb"
+    
+    def _load_cached(
+        self,
+        clean_seq: str,
+        output_pdb: Optional[str] = None,
+        return_pdb: bool = False
+    ) -> Optional[Dict]:
+        """命中缓存时直接返回结果（不占用API限流额度）"""
+        if not self.cache_dir:
+            return None
+        json_path, npy_path, pdb_path = self._cache_paths(clean_seq)
+        if not all(os.path.exists(path) for path in (json_path, npy_path, pdb_path)):
+            return None
+        
+        try:
+            with open(json_path) as f:
+                result = json.load(f)
+            result["plddt_per_residue"] = np.load(npy_path)
+            # PDB文本较大，仅在需要时读取
+            pdb_content = None
+            if output_pdb or return_pdb:
+                with open(pdb_path) as f:
+                    pdb_content = f.read()
+        except (OSError, ValueError):
+            return None  # 缓存损坏时重新请求API
+        
+        if output_pdb:
+            os.makedirs(Path(output_pdb).parent, exist_ok=True)
+            with open(output_pdb, "w") as f:
+                f.write(pdb_content)
+        
+        if return_pdb:
+            result["pdb_content"] = pdb_content
+        return result
+    
+    def _save_cache(self, clean_seq: str, result: Dict, pdb_content: str):
+        """原子写入缓存（先写临时文件再替换，避免并发/中断产生半个文件）"""
+        if not self.cache_dir:
+            return
+        json_path, npy_path, pdb_path = self._cache_paths(clean_seq)
+        meta = {k: v for k, v in result.items() if k not in ("pdb_content", "plddt_per_residue")}
+        
+        for path, content in ((pdb_path, pdb_content), (json_path, json.dumps(meta))):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        
+        tmp_path = f"{npy_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, result["plddt_per_residue"])  # float16
+        os.replace(tmp_path, npy_path)
+    
+    def predict_structure(
+        self,
+        sequence: str,
+        output_pdb: Optional[str] = None,
+        return_pdb: bool = False
+    ) -> Dict:
         """
         预测蛋白质结构
         
         Args:
             sequence: 氨基酸序列（可含X，自动清理）
             output_pdb: 可选，保存PDB文件路径
+            return_pdb: 是否在结果中附带PDB文本（默认不附带，节省内存）
         
         Returns:
             {
                 "success": bool,
                 "plddt": float,        # 平均pLDDT
-                "plddt_per_residue": List[float],  # 残基级pLDDT
-                "pdb_content": str,    # PDB文本
+                "plddt_per_residue": np.ndarray[float16],  # 残基级pLDDT
+                "pdb_content": str,    # PDB文本（仅return_pdb=True时）
                 "error": str (if failed)
             }
         """
@@ -56,84 +157,174 @@ class ESMFoldValidator:
         if len(clean_seq) == 0:
             return {"success": False, "error": "序列清理后为空"}
         
+        cached = self._load_cached(clean_seq, output_pdb, return_pdb)
+        if cached is not None:
+            return cached
+        
         # 限流保护
         self._enforce_rate_limit()
         
         try:
-            # ESMFold API限制400残基，截断长序列
-            seq_for_api = clean_seq[:400] if len(clean_seq) > 400 else clean_seq
-            seq_for_api = clean_seq[:400] if len(clean_seq) > 400 else clean_seq
             response = requests.post(
                 self.api_url,
-                data=seq_for_api,
+                data=clean_seq[:self.max_residues],
                 headers=self.headers,
                 timeout=60
             )
             response.raise_for_status()
-            
-            pdb_content = response.text
-            
-            # 解析pLDDT（从PDB B-factor列）
-            plddt, plddt_per_residue = self._parse_plddt(pdb_content)
-            
-            # 保存PDB（可选）
-            if output_pdb:
-                os.makedirs(Path(output_pdb).parent, exist_ok=True)
-                with open(output_pdb, "w") as f:
-                    f.write(pdb_content)
-            
-            return {
-                "success": True,
-                "plddt": plddt,
-                "plddt_per_residue": plddt_per_residue,
-                "pdb_content": pdb_content,
-                "sequence_length": len(clean_seq),
-                "truncated": len(clean_seq) > 400
-            }
+            return self._build_result(clean_seq, response.text, output_pdb, return_pdb)
         
         except requests.exceptions.RequestException as e:
             return {"success": False, "error": f"API请求失败: {str(e)}"}
         except Exception as e:
             return {"success": False, "error": f"未知错误: {str(e)}"}
     
+    async def _predict_structure_async(
+        self,
+        session: aiohttp.ClientSession,
+        sequence: str,
+        rate_lock: asyncio.Lock,
+        output_pdb: Optional[str] = None,
+        return_pdb: bool = False
+    ) -> Dict:
+        """predict_structure的异步版本（返回格式相同）"""
+        clean_seq = self._clean_sequence(sequence)
+        if len(clean_seq) == 0:
+            return {"success": False, "error": "序列清理后为空"}
+        
+        cached = self._load_cached(clean_seq, output_pdb, return_pdb)
+        if cached is not None:
+            return cached
+        
+        await self._enforce_rate_limit_async(rate_lock)
+        
+        try:
+            async with session.post(
+                self.api_url,
+                data=clean_seq[:self.max_residues],
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=60)
+            ) as response:
+                response.raise_for_status()
+                pdb_content = await response.text()
+            return self._build_result(clean_seq, pdb_content, output_pdb, return_pdb)
+        
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return {"success": False, "error": f"API请求失败: {str(e)}"}
+        except Exception as e:
+            return {"success": False, "error": f"未知错误: {str(e)}"}
+    
+    def _build_result(
+        self,
+        clean_seq: str,
+        pdb_content: str,
+        output_pdb: Optional[str] = None,
+        return_pdb: bool = False
+    ) -> Dict:
+        """解析API返回的PDB并组装验证结果"""
+        # 解析pLDDT（从PDB B-factor列）
+        plddt, plddt_per_residue = self._parse_plddt(pdb_content)
+        
+        # 保存PDB（可选）
+        if output_pdb:
+            os.makedirs(Path(output_pdb).parent, exist_ok=True)
+            with open(output_pdb, "w") as f:
+                f.write(pdb_content)
+        
+        result = {
+            "success": True,
+            "plddt": plddt,
+            "plddt_per_residue": plddt_per_residue,
+            "sequence_length": len(clean_seq),
+            "truncated": len(clean_seq) > self.max_residues
+        }
+        self._save_cache(clean_seq, result, pdb_content)
+        if return_pdb:
+            result["pdb_content"] = pdb_content
+        return result
+    
 
     def _parse_plddt(self, pdb_text: str) -> tuple:
-        """从PDB B-factor列提取pLDDT"""
-        bfactors = []
-        for line in pdb_text.split("\n"):
-            if line.startswith("ATOM") and line[13:15] == "CA":  # 仅Cα原子
-                try:
-                    bfactor = float(line[60:66].strip())
-                    bfactor *=100
-                    bfactors.append(bfactor)
-                except (ValueError, IndexError):
-                    pass
-        avg_plddt = sum(bfactors) / len(bfactors) if bfactors else 0.0
-        return avg_plddt, bfactors
+        """从PDB B-factor列提取pLDDT（残基级结果为float16数组，精度约0.1足够报告使用）"""
+        # 一次numpy.fromregex提取所有Cα原子的B-factor（第61-66列），避免逐行Python解析
+        bfactors = np.fromregex(io.BytesIO(pdb_text.encode()), _CA_BFACTOR_RE, dtype=[("b", "f4")])["b"]
+        bfactors *= 100
+        avg_plddt = float(bfactors.mean()) if bfactors.size else 0.0
+        return avg_plddt, bfactors.astype(np.float16)
     
 
-    def batch_validate(self, sequences: List[str], output_dir: str = "outputs/validation") -> List[Dict]:
+    def batch_validate(
+        self,
+        sequences: List[str],
+        output_dir: str = "outputs/validation",
+        return_pdb: bool = False
+    ) -> List[Dict]:
         """
-        批量验证多个序列
+        批量验证多个序列（PDB文件始终写入output_dir）
         
         Returns:
             List of validation results (same format as predict_structure)
         """
+        coro = self.batch_validate_async(sequences, output_dir=output_dir, return_pdb=return_pdb)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)
+        # 已有运行中的事件循环（Jupyter/Streamlit/异步调用方）时，在独立线程中执行
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(asyncio.run, coro).result()
+    
+    async def batch_validate_async(
+        self,
+        sequences: List[str],
+        output_dir: str = "outputs/validation",
+        concurrency: int = 4,
+        return_pdb: bool = False
+    ) -> List[Dict]:
+        """
+        异步批量验证：最多concurrency个请求同时在途，请求发起仍遵守min_interval限流
+        
+        Returns:
+            List of validation results (same order as sequences)
+        """
         os.makedirs(output_dir, exist_ok=True)
-        results = []
+        semaphore = asyncio.Semaphore(concurrency)
+        rate_lock = asyncio.Lock()
         
         print(f"🔬 批量验证 {len(sequences)} 个序列 (ESMFold API)...")
+        
+        # 按清洗后序列去重：重复序列只请求一次API（各占30秒限流额度），结果分发给每个design_id
+        groups: Dict[str, List[int]] = {}
         for i, seq in enumerate(sequences, 1):
-            print(f"   [{i}/{len(sequences)}] 正在验证...")
-            result = self.predict_structure(
-                seq, 
-                output_pdb=f"{output_dir}/design_{i}.pdb"
+            groups.setdefault(self._clean_sequence(seq), []).append(i)
+        
+        async def validate_one(session: aiohttp.ClientSession, design_ids: List[int]) -> Dict:
+            i = design_ids[0]
+            async with semaphore:
+                print(f"   [{i}/{len(sequences)}] 正在验证...")
+                return await self._predict_structure_async(
+                    session,
+                    sequences[i - 1],
+                    rate_lock,
+                    output_pdb=f"{output_dir}/design_{i}.pdb",
+                    return_pdb=return_pdb
+                )
+        
+        async with aiohttp.ClientSession() as session:
+            group_results = await asyncio.gather(
+                *(validate_one(session, design_ids) for design_ids in groups.values())
             )
-            result["design_id"] = i
-            results.append(result)
+        
+        results = [None] * len(sequences)
+        for design_ids, result in zip(groups.values(), group_results):
+            first_pdb = f"{output_dir}/design_{design_ids[0]}.pdb"
+            for i in design_ids:
+                if i != design_ids[0] and result["success"] and os.path.exists(first_pdb):
+                    shutil.copyfile(first_pdb, f"{output_dir}/design_{i}.pdb")
+                results[i - 1] = {**result, "design_id": i}
         
         # 生成总结
         passed = sum(1 for r in results if r["success"] and r["plddt"] > 80)
         print(f"\n✅ 验证完成: {passed}/{len(sequences)} 通过 (pLDDT>80)")
         
-        return results
\ No newline at end of file
+        return list(results)
@@ -1,30 +1,146 @@
 import numpy as np
 import pandas as pd
-from mhcflurry import Class1AffinityPredictor
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
+import os
+import sqlite3
+import threading
 import time
-import re
 
+
+_STANDARD_AA = frozenset(b"ACDEFGHIKLMNPQRSTVWY")
+
+
+def _build_aa_table() -> bytes:
+    """
+    256项字节映射表：标准氨基酸（大小写）-> 大写本身，其他字母 -> 'A'
+    非字母字节不在表中处理，由translate的delete参数删除
+    """
+    table = bytearray(range(256))
+    for c in range(256):
+        upper = c - 32 if 97 <= c <= 122 else c
+        if 65 <= upper <= 90:
+            table[c] = upper if upper in _STANDARD_AA else ord("A")
+    return bytes(table)
+
+
+_AA_TABLE = _build_aa_table()
+_NON_LETTER_BYTES = bytes(c for c in range(256) if not (65 <= c <= 90 or 97 <= c <= 122))
+
+
+def _kmers(clean_chain: bytes, length: int) -> np.ndarray:
+    """
+    滑动窗口切分所有长度为length的肽段（stride tricks视图 + 一次内存拷贝，无逐肽段Python切片）
+    调用方需保证 len(clean_chain) >= length
+    """
+    buf = np.frombuffer(clean_chain, dtype=np.uint8)
+    windows = np.lib.stride_tricks.sliding_window_view(buf, length)  # shape (N-L+1, L)
+    pep_arr = np.ascontiguousarray(windows).view(f"|S{length}").ravel()
+    return np.char.decode(pep_arr, "ascii")
+
+
+def _model_version(predictor) -> str:
+    """模型版本标识：已加载模型名（含权重哈希）的摘要，无法获取时退回MHCflurry版本号"""
+    try:
+        names = sorted(predictor.manifest_df["model_name"])
+    except Exception:
+        import mhcflurry
+        return f"mhcflurry-{mhcflurry.__version__}"
+    return hashlib.sha256("\n".join(names).encode()).hexdigest()[:16]
+
+
+class _IC50Cache:
+    """
+    (peptide, allele) -> IC50 的SQLite磁盘缓存
+    按等位基因批量读写：一次查询取回整批肽段，避免逐对get的SQLite往返
+    """
+    
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # predict_async的线程池会并发访问：共享连接 + 锁
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS ic50 ("
+                "allele TEXT, peptide TEXT, value REAL, PRIMARY KEY (allele, peptide)"
+                ") WITHOUT ROWID"
+            )
+    
+    def get_many(self, peptides, allele) -> np.ndarray:
+        """返回与peptides顺序一致的IC50数组，未命中为NaN"""
+        values = np.full(len(peptides), np.nan)
+        with self._lock:
+            # 肽段写入临时表后一次JOIN查询取回全部命中
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS query (i INTEGER PRIMARY KEY, peptide TEXT)")
+            self._conn.execute("DELETE FROM query")
+            self._conn.executemany("INSERT INTO query VALUES (?, ?)", enumerate(peptides))
+            rows = self._conn.execute(
+                "SELECT query.i, ic50.value FROM query "
+                "JOIN ic50 ON ic50.allele = ? AND ic50.peptide = query.peptide",
+                (allele,)
+            ).fetchall()
+            self._conn.commit()
+        if rows:
+            idx, vals = zip(*rows)
+            values[list(idx)] = vals
+        return values
     
+    def put_many(self, peptides, alleles, values):
+        """单个事务批量写入（NaN不写入）"""
+        rows = [
+            (allele, pep, value) for pep, allele, value in zip(peptides, alleles, values)
+            if not np.isnan(value)
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO ic50 VALUES (?, ?, ?)", rows)
+
+
+# 默认等位基因（HLA-A02:01为人群中最常见的HLA-A型）
+DEFAULT_ALLELES = ["HLA-A02:01"]
+# 可选的IC50磁盘缓存目录（需显式传入cache_dir启用）
+DEFAULT_CACHE_DIR = "~/.cache/mhcflurry_ic50"
+
+_PREDICTOR_SINGLETON = None
+
+
+def _get_predictor():
+    """
+    进程内共享的Class1AffinityPredictor（权重文件与Keras模型只加载一次）
+    第一次运行会自动下载模型
+    """
+    global _PREDICTOR_SINGLETON
+    if _PREDICTOR_SINGLETON is None:
+        # 延迟导入：mhcflurry会初始化TensorFlow，只在真正需要预测时才付出该开销
+        from mhcflurry import Class1AffinityPredictor
+        print("Load MHCflurry Predictor...")
+        _PREDICTOR_SINGLETON = Class1AffinityPredictor.load()
+        print("✅ MHCflurry Loading finished")
+    return _PREDICTOR_SINGLETON
 
 
 class MHCflurryPredictor:
-    def __init__(self, alleles=None):
+    def __init__(self, alleles=None, cache_dir=None):
         """
         initialize MHCflurry predictor
         :param alleles: the potential alleles，HLA ttypes
+        :param cache_dir: (peptide, allele) -> IC50 磁盘缓存目录，默认None不启用
+                          （如 DEFAULT_CACHE_DIR）
         """
-        if alleles is None:
-            # common HLA-A and HLA-B alleles
-            self.alleles = [
-                "HLA-A02:01"
-            ]
-        else:
-            self.alleles = alleles
+        self.alleles = list(DEFAULT_ALLELES if alleles is None else alleles)
         
-        # 加载预测器（第一次运行会自动下载模型）
-        print("Load MHCflurry Predictor...")
-        self.predictor = Class1AffinityPredictor.load()
-        print("✅ MHCflurry Loading finished")
+        # 加载预测器（多个实例共享同一份模型）
+        self.predictor = _get_predictor()
+        
+        # 预测结果只由模型权重决定：缓存按模型版本分目录，换模型后自动失效
+        self._cache = None
+        if cache_dir:
+            self._cache = _IC50Cache(os.path.join(
+                os.path.expanduser(cache_dir), _model_version(self.predictor), "ic50.sqlite3"
+            ))
+        
+        # 后台推理线程池：MHCflurry推理可与ESMFold等上游步骤重叠执行
+        self._pool = ThreadPoolExecutor(max_workers=2)
     
     def predict_peptides(self, sequence, peptide_lengths=[9]):
         """
@@ -33,44 +149,119 @@ class MHCflurryPredictor:
         将蛋白序列切分为所有可能的肽段，并预测每个肽段的IC50 (nM)
         返回DataFrame，包含肽段、等位基因、IC50等信息
         """
-        chains = sequence.split('/')
-        peptides = []
-        for chain in chains:
-            # 清洗单条链（移除可能残留的其他非字母）
-            # 2. 将所有非标准氨基酸（不是 ACDEFGHIKLMNPQRSTVWY 的字母）替换为 A
-            #   这里包括 X, B, Z, J, O, U 等
-            clean_chain = re.sub(r'[^A-Z]', '', chain.upper())
-
-            standard_aa = set("ACDEFGHIKLMNPQRSTVWY")
-            clean_chain = ''.join(aa if aa in standard_aa else 'A' for aa in clean_chain)
-            if len(clean_chain) < min(peptide_lengths):
-                continue
+        # 清洗每条链（一次查表translate完成）
+        # 1. 移除非字母字符，小写转大写
+        # 2. 将所有非标准氨基酸（不是 ACDEFGHIKLMNPQRSTVWY 的字母）替换为 A
+        #   这里包括 X, B, Z, J, O, U 等
+        # 清洗后短于最短肽段长度的链直接过滤
+        min_len = min(peptide_lengths)
+        chains = [
+            clean_chain for clean_chain in (
+                chain.encode("ascii", "ignore").translate(_AA_TABLE, _NON_LETTER_BYTES)
+                for chain in sequence.split('/')
+            )
+            if len(clean_chain) >= min_len
+        ]
+        
+        # 肽段总数可预先算出：按 (链, 长度) 分段直接写入预分配数组
+        n_peptides = sum(max(0, len(c) - length + 1) for c in chains for length in peptide_lengths)
+        if n_peptides == 0:
+            return pd.DataFrame()
+        
+        peptides = np.empty(n_peptides, dtype=f"U{max(peptide_lengths)}")
+        lengths = np.empty(n_peptides, dtype=np.int8)
+        pos = 0
+        for clean_chain in chains:
             for length in peptide_lengths:
-                for i in range(len(clean_chain) - length + 1):
-                    peptides.append(clean_chain[i:i+length])
-            if len(sequence) < min(peptide_lengths):
-                return pd.DataFrame()
-
-
-        # MHCflurry可以同时预测多个肽段和多个等位基因
-        results = []
-        for allele in self.alleles:
+                count = len(clean_chain) - length + 1
+                if count > 0:
+                    peptides[pos:pos + count] = _kmers(clean_chain, length)
+                    lengths[pos:pos + count] = length
+                    pos += count
+        
+        # 去重：每个唯一肽段每个等位基因只做一次MHCflurry前向推理，再按逆索引映射回全部肽段
+        uniq, inverse = np.unique(peptides, return_inverse=True)
+        uniq = uniq.tolist()
+        
+        predictions = self._predict_ic50(uniq)
+        if not predictions:
+            return pd.DataFrame()
+        
+        # 列式预分配结果数组，按等位基因分段填充，最后一次构建DataFrame
+        # allele列为固定等位基因集合上的categorical，length为int8
+        n_total = n_peptides * len(predictions)
+        peps_out = np.empty(n_total, dtype=object)
+        alleles_out = np.empty(n_total, dtype=object)
+        ic50_out = np.empty(n_total, dtype=np.float32)
+        len_out = np.empty(n_total, dtype=np.int8)
+        for k, (allele, ic50_uniq) in enumerate(predictions):
+            block = slice(k * n_peptides, (k + 1) * n_peptides)
+            peps_out[block] = peptides
+            alleles_out[block] = allele
+            ic50_out[block] = ic50_uniq[inverse]
+            len_out[block] = lengths
+        
+        df = pd.DataFrame({
+            "peptide": peps_out,
+            "allele": pd.Categorical(alleles_out, categories=list(dict.fromkeys(self.alleles))),
+            "ic50": ic50_out,
+            "length": len_out
+        })
+        return df
+    
+    def _predict_ic50(self, peptides):
+        """
+        预测每个等位基因下各肽段的IC50 (nM)
+        返回 [(allele, ic50数组)]，数组顺序与peptides一致；预测失败的等位基因被跳过
+        """
+        ic50 = np.full((len(self.alleles), len(peptides)), np.nan)
+        
+        # 先查(peptide, allele)磁盘缓存，只对未命中的配对做推理
+        if self._cache is not None:
+            for i, allele in enumerate(self.alleles):
+                ic50[i] = self._cache.get_many(peptides, allele)
+        
+        missing_a, missing_p = np.nonzero(np.isnan(ic50))
+        if missing_a.size:
+            miss_peptides = [peptides[j] for j in missing_p]
+            miss_alleles = [self.alleles[i] for i in missing_a]
+            values = self._predict_pairs(miss_peptides, miss_alleles)
+            ic50[missing_a, missing_p] = values
+            
+            if self._cache is not None:
+                self._cache.put_many(miss_peptides, miss_alleles, values.tolist())
+        
+        return [
+            (allele, ic50[i]) for i, allele in enumerate(self.alleles)
+            if not np.isnan(ic50[i]).any()
+        ]
+    
+    def _predict_pairs(self, peptides, alleles) -> np.ndarray:
+        """对(肽段, 等位基因)配对做MHCflurry推理；预测失败的等位基因对应位置为NaN"""
+        # MHCflurry可以同时预测多个肽段和多个等位基因：全部配对一次批量推理
+        try:
+            batch = self.predictor.predict_to_dataframe(
+                peptides=peptides,
+                alleles=alleles,
+                include_individual_model_predictions=False,
+                include_percentile_ranks=False,
+                include_confidence_intervals=False
+            )
+            return batch["prediction"].to_numpy(dtype=np.float64)
+        except Exception as e:
+            print(f"⚠️ 批量预测失败，逐个等位基因预测: {e}")
+        
+        values = np.full(len(peptides), np.nan)
+        alleles = np.asarray(alleles)
+        for allele in dict.fromkeys(alleles.tolist()):
+            mask = alleles == allele
             try:
                 # 关键修正：使用predictor.predict方法
-                ic50 = self.predictor.predict(peptides, allele=allele)
-                for pep, ic in zip(peptides, ic50):
-                    results.append({
-                        "peptide": pep,
-                        "allele": allele,
-                        "ic50": ic,
-                        "length": len(pep)
-                    })
+                values[mask] = self.predictor.predict(np.asarray(peptides)[mask].tolist(), allele=allele)
             except Exception as e:
                 print(f"⚠️ 等位基因 {allele} 预测失败: {e}")
                 continue
-        
-        df = pd.DataFrame(results)
-        return df
+        return values
     
     def aggregate_immunogenicity(self, df):
         """
@@ -87,30 +278,43 @@ class MHCflurryPredictor:
                 "error": ""
             }
         
-        strong = df[df["ic50"] < 50]
-        weak = df[(df["ic50"] >= 50) & (df["ic50"] < 500)]
+        # float32数组上做布尔掩码计数（NaN视为非结合），按categorical整数编码bincount分等位基因
+        alleles = df["allele"]
+        if not isinstance(alleles.dtype, pd.CategoricalDtype):
+            alleles = alleles.astype("category")
+        codes = alleles.cat.codes.to_numpy(dtype=np.intp)
+        ic50 = df["ic50"].to_numpy(dtype=np.float32)
+        strong_mask = ic50 < 50
+        n_strong = int(strong_mask.sum())
+        n_weak = int(((ic50 >= 50) & (ic50 < 500)).sum())
+        # 缺失等位基因（编码-1）与groupby一致：计入总数，但不出现在details中
+        strong_counts = np.bincount(
+            codes[strong_mask & (codes >= 0)], minlength=len(alleles.cat.categories)
+        )
         
         # 安全评级
-        if len(strong) > 0:
+        if n_strong > 0:
             safety = "RISK"
-        elif len(weak) > 5:
+        elif n_weak > 5:
             safety = "CAUTION"
         else:
             safety = "SAFE"
         
-        # 按等位基因分组，列出强结合肽段
+        # 按等位基因列出强结合肽段（只遍历有强结合的等位基因）
         details = []
-        if len(strong) > 0:
-            for allele, group in strong.groupby("allele"):
+        if n_strong > 0:
+            peptides = df["peptide"].to_numpy()
+            for k in np.flatnonzero(strong_counts):
+                idx = np.flatnonzero(strong_mask & (codes == k))[:5]  # 只显示前5个
                 details.append({
-                    "allele": allele,
-                    "peptides": group["peptide"].tolist()[:5]  # 只显示前5个
+                    "allele": alleles.cat.categories[k],
+                    "peptides": peptides[idx].tolist()
                 })
         
         return {
             "success": True,
-            "strong_binders": len(strong),
-            "weak_binders": len(weak),
+            "strong_binders": n_strong,
+            "weak_binders": n_weak,
             "safety": safety,
             "details": details,
             "job_url": "",
@@ -125,4 +329,16 @@ class MHCflurryPredictor:
         - 扫描所有肽段长度 (8-11)
         """
         df = self.predict_peptides(sequence)
-        return self.aggregate_immunogenicity(df)
\ No newline at end of file
+        return self.aggregate_immunogenicity(df)
+    
+    def predict_async(self, sequence) -> Future:
+        """
+        在后台线程中执行predict，立即返回Future
+        用法：先为所有设计提交任务，再按顺序调用 .result() 取回结果
+        """
+        return self._pool.submit(self.predict, sequence)
+    
+    @classmethod
+    def single_allele(cls, allele="HLA-A02:01", **kwargs):
+        """只预测单个等位基因（默认HLA-A02:01）的快速模式"""
+        return cls(alleles=[allele], **kwargs)
\ No newline at end of file
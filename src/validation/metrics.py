@@ -1,12 +1,24 @@
 """
 验证指标计算：pLDDT, TM-score, RMSD等
 """
-from typing import List
+from typing import List, Tuple
 import numpy as np
 
+
+def _plddt_stats(values) -> Tuple[float, float]:
+    """
+    返回 (平均pLDDT, pLDDT>70的比例)；空输入统一返回 (0.0, 0.0)
+    兼容List[float]与ESMFold返回的float16数组（按float64计算）
+    """
+    arr = np.asarray(values, dtype=np.float64)
+    if arr.size == 0:
+        return 0.0, 0.0
+    return float(arr.mean()), float((arr > 70).mean())
+
+
 def calculate_plddt(b_factors: List[float]) -> float:
     """计算平均pLDDT"""
-    return np.mean(b_factors) if b_factors else 0.0
+    return _plddt_stats(b_factors)[0]
 
 
 def assess_foldability(plddt: float) -> str:
@@ -25,40 +37,56 @@ def assess_foldability(plddt: float) -> str:
     else:
         return "UNFOLDED"
 
+_FOLDABILITY_THRESHOLDS = np.array([50, 70, 90])
+_FOLDABILITY_LABELS = np.array(["UNFOLDED", "LOW", "MEDIUM", "HIGH"])
+
+
+def assess_foldability_array(plddts) -> np.ndarray:
+    """
+    assess_foldability的向量化版本（searchsorted查阈值区间，无逐元素分支）
+    
+    Returns:
+        与输入等长的标签数组，取值同assess_foldability
+    """
+    return _FOLDABILITY_LABELS[np.searchsorted(_FOLDABILITY_THRESHOLDS, np.asarray(plddts), side="right")]
+
 def calculate_tm_score(plddt_values: List[float]) -> float:
     """
     估算TM-score（简化版，基于pLDDT分布）
     注: 精确TM-score需结构比对，此处为快速估算
     """
     # 经验公式: TM-score ≈ 0.2 + 0.8 * (pLDDT>70的比例)
-    high_confidence_ratio = sum(1 for p in plddt_values if p > 70) / len(plddt_values)
+    _, high_confidence_ratio = _plddt_stats(plddt_values)
     return 0.2 + 0.8 * high_confidence_ratio
 
 def generate_validation_report(results: List[dict]) -> str:
     """生成Markdown格式验证报告"""
+    import pandas as pd  # 只有生成报告时需要pandas，延迟导入以加快模块加载
+    
     report = "# ESMFold验证报告\n\n"
     report += "| Design | pLDDT | 可折叠性 | 状态 |\n"
     report += "|--------|-------|----------|------|\n"
     
-
-
-    for r in results:
-        if not r["success"]:
-            status = "❌ 失败"
-            plddt_str = "N/A"
-            foldability = "N/A"
-        else:
-            plddt = r["plddt"]
-            foldability = assess_foldability(plddt)
-            status = "✅ 通过" if plddt > 80 else "⚠️ 边界"
-            plddt_str = f"{plddt:.1f}"
-        
-        report += f"| {r['design_id']} | {plddt_str} | {foldability} | {status} |\n"
+    # 整列向量化计算各行状态（失败结果可能缺少plddt字段）
+    df = pd.DataFrame(results, columns=["design_id", "success", "plddt"])
+    success = df["success"].fillna(False).astype(bool).to_numpy()
+    plddt = df["plddt"].to_numpy(dtype=float)
+    
+    foldability = np.where(success, assess_foldability_array(plddt), "N/A")
+    passed_mask = success & (plddt > 80)
+    status = np.where(~success, "❌ 失败", np.where(passed_mask, "✅ 通过", "⚠️ 边界"))
+    plddt_str = np.where(success, pd.Series(plddt).map("{:.1f}".format).to_numpy(), "N/A")
+    
+    rows = (
+        "| " + df["design_id"].astype(str) + " | " + plddt_str + " | " + foldability + " | " + status + " |\n"
+    )
+    report += "".join(rows)
     
     # 添加总结
-    passed = sum(1 for r in results if r["success"] and r["plddt"] > 80)
+    passed = int(passed_mask.sum())
     total = len(results)
-    report += f"\n## 总结\n- 通过率: {passed}/{total} ({passed/total*100:.0f}%)\n"
+    pass_rate = passed / total * 100 if total else 0
+    report += f"\n## 总结\n- 通过率: {passed}/{total} ({pass_rate:.0f}%)\n"
     report += "- 工业标准: pLDDT > 80 为可实验候选\n"
     
-    return report
\ No newline at end of file
+    return report
@@ -6,6 +6,11 @@
 """
 from typing import List, Dict
 
+import numpy as np
+
+TOP_K = 3  # 首选 + 备选送测数量
+_FEATURE_KEYS = ("score", "plddt", "kd_nm", "immuno_strong", "immuno_weak")
+
 class WetlabPriorityRanker:
     def __init__(self):
         # 权重设计（基于工业实践）
@@ -16,7 +21,7 @@ class WetlabPriorityRanker:
             "immunogenicity": 0.15  # 免疫原性（负向）
         }
     
-    def rank_designs(self, designs: List[Dict]) -> List[Dict]:
+    def rank_designs(self, designs: List[Dict], sort_all: bool = True) -> List[Dict]:
         """
         designs: [
             {
@@ -29,32 +34,44 @@ class WetlabPriorityRanker:
             },
             ...
         ]
+        sort_all: False时只对Top 3排序（partition, O(N)；同分按输入顺序），其余设计按输入顺序排在其后
         """
-        for d in designs:
-            # 归一化各指标到0-1
-            score_norm = 1.0 - min(d["score"] / 1.5, 1.0)  # score越低越好
-            plddt_norm = min(d["plddt"] / 100, 1.0)        # pLDDT越高越好
-            affinity_norm = min(50 / max(d["kd_nm"], 1), 1.0)  # KD越低越好
-            immuno_penalty = 1.0 - min((d["immuno_strong"] * 2 + d["immuno_weak"]) / 10, 1.0)
-            
-            # 综合评分
-            d["priority_score"] = (
-                self.weights["score"] * score_norm +
-                self.weights["plddt"] * plddt_norm +
-                self.weights["affinity"] * affinity_norm +
-                self.weights["immunogenicity"] * immuno_penalty
-            )
+        if not designs:
+            return []
+        
+        # 一次性抽取为特征矩阵 (N, 5)，各指标按列向量化归一化到0-1
+        arr = np.array([[d[k] for k in _FEATURE_KEYS] for d in designs], dtype=np.float32)
+        feats = np.column_stack([
+            1.0 - np.minimum(arr[:, 0] / 1.5, 1.0),                         # score越低越好
+            np.minimum(arr[:, 1] / 100, 1.0),                               # pLDDT越高越好
+            np.minimum(50 / np.maximum(arr[:, 2], 1), 1.0),                 # KD越低越好
+            1.0 - np.minimum((arr[:, 3] * 2 + arr[:, 4]) / 10, 1.0)         # 免疫原性惩罚
+        ])
+        weights = np.array(
+            [self.weights[k] for k in ("score", "plddt", "affinity", "immunogenicity")], dtype=np.float32
+        )
+        # 综合评分
+        priority = feats @ weights
         
-        # 按优先级排序
-        sorted_designs = sorted(designs, key=lambda x: x["priority_score"], reverse=True)
+        # 按优先级排序（stable与原sorted一致，同分保持输入顺序）
+        if sort_all or len(designs) <= TOP_K:
+            order = np.argsort(-priority, kind="stable")
+        else:
+            # 只需Top 3：partition O(N) 求第3高的分数作为阈值，只对不低于阈值的候选排序
+            # 同分按输入顺序，与sort_all=True选出的Top 3一致
+            kth = np.partition(-priority, TOP_K - 1)[TOP_K - 1]
+            cand = np.flatnonzero(-priority <= kth)
+            top_idx = cand[np.lexsort((cand, -priority[cand]))][:TOP_K]
+            rest = np.ones(len(designs), dtype=bool)
+            rest[top_idx] = False
+            order = np.concatenate([top_idx, np.flatnonzero(rest)])
         
-        # 添加湿实验建议
-        for i, d in enumerate(sorted_designs):
-            if i == 0:
-                d["wetlab_recommendation"] = "✅ 首选送测"
-            elif i < 3:
-                d["wetlab_recommendation"] = "✅ 备选送测"
-            else:
-                d["wetlab_recommendation"] = "⚠️ 低优先级"
+        # 添加湿实验建议（按排名切片赋值）
+        recommendations = np.full(len(designs), "⚠️ 低优先级", dtype=object)
+        recommendations[order[1:TOP_K]] = "✅ 备选送测"
+        recommendations[order[:1]] = "✅ 首选送测"
+        for d, p, rec in zip(designs, priority.tolist(), recommendations):
+            d["priority_score"] = p
+            d["wetlab_recommendation"] = rec
         
-        return sorted_designs
\ No newline at end of file
+        return [designs[i] for i in order]